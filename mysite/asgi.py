@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_ON_STARTUP:
+    from polls.warmup import warm_in_background
+    # sync views run in other threads, which cannot use connections opened here
+    warm_in_background(connect=False)
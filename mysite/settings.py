@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 import os.path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,11 +48,31 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "polls.middleware.CachedAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Subsystems that voting-only workers can leave out to boot faster.
+# The admin needs messages, so it is off by default when messages are off.
+ENABLE_MESSAGES = config('ENABLE_MESSAGES', default=True, cast=bool)
+ENABLE_ADMIN = config('ENABLE_ADMIN', default=ENABLE_MESSAGES, cast=bool)
+ENABLE_ACCOUNTS = config('ENABLE_ACCOUNTS', default=True, cast=bool)
+
+if ENABLE_ADMIN and not ENABLE_MESSAGES:
+    raise ImproperlyConfigured("ENABLE_ADMIN needs ENABLE_MESSAGES, set it to False too.")
+
+if not ENABLE_ADMIN:
+    INSTALLED_APPS.remove("django.contrib.admin")
+if not ENABLE_MESSAGES:
+    INSTALLED_APPS.remove("django.contrib.messages")
+    MIDDLEWARE.remove("django.contrib.messages.middleware.MessageMiddleware")
+
+# Per-site cache of pages for anonymous visitors
+if config('CACHE_ANONYMOUS_PAGES', default=False, cast=bool):
+    MIDDLEWARE.insert(1, "polls.middleware.AnonymousUpdateCacheMiddleware")
+    MIDDLEWARE.append("polls.middleware.AnonymousFetchFromCacheMiddleware")
+
 ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
@@ -70,16 +91,55 @@ TEMPLATES = [
     },
 ]
 
+if not ENABLE_MESSAGES:
+    TEMPLATES[0]["OPTIONS"]["context_processors"].remove(
+        "django.contrib.messages.context_processors.messages")
+
 WSGI_APPLICATION = "mysite.wsgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Seconds to keep database connections open between requests (0 closes them).
+CONN_MAX_AGE = config('CONN_MAX_AGE', default=0, cast=int)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+    }
+}
+
+# Votes can be split over several SQLite files by question id, so a busy
+# question does not lock the votes of the others.
+VOTE_DATABASES = [f"votes{n}" for n in range(config('VOTE_SHARDS', default=0, cast=int))]
+
+# Vote databases left over from a higher VOTE_SHARDS. `rebalance_votes`
+# moves their votes back, then the files can be deleted.
+RETIRED_VOTE_DATABASES = sorted(path.stem for path in BASE_DIR.glob("votes*.sqlite3")
+                                if path.stem not in VOTE_DATABASES)
+
+for alias in VOTE_DATABASES + RETIRED_VOTE_DATABASES:
+    DATABASES[alias] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"{alias}.sqlite3",
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+    }
+
+DATABASE_ROUTERS = ["polls.sharding.VoteShardRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# A shared cache (e.g. django.core.cache.backends.redis.RedisCache) lets
+# `warm_polls` and cached pages serve every worker.
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config('CACHE_LOCATION', default=""),
     }
 }
 
@@ -114,6 +174,16 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Serve `collectstatic` output with content-hashed names, far-future cache
+# headers and precompressed gzip/brotli variants through WhiteNoise.  Needs
+# `collectstatic` to have been run, so it is off for development and tests,
+# where runserver serves the static files.
+if config('STATIC_MANIFEST', default=False, cast=bool):
+    STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+    MIDDLEWARE.insert(1, "whitenoise.middleware.WhiteNoiseMiddleware")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -126,3 +196,20 @@ AUTHENTICATION_BACKENDS = [
 
 LOGIN_REDIRECT_URL = '/polls/'    # show list of polls
 LOGOUT_REDIRECT_URL = '/accounts/login/'
+
+# Seconds an authenticated user is cached for read-only requests (0 disables).
+# Only turn it on with a shared CACHE_BACKEND: a password change or
+# deactivation clears the cached user in the cache of one process only.
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=0, cast=int)
+
+# Seconds anonymous poll pages may be cached by browsers and proxies.
+POLLS_CACHE_MAX_AGE = config('POLLS_CACHE_MAX_AGE', default=60, cast=int)
+
+CACHE_MIDDLEWARE_SECONDS = POLLS_CACHE_MAX_AGE
+
+# Warm up each worker in the background when it starts.
+WARM_ON_STARTUP = config('WARM_ON_STARTUP', default=False, cast=bool)
+
+# Number of most voted open questions and seconds to spend warming up.
+WARM_POLLS_LIMIT = config('WARM_POLLS_LIMIT', default=10, cast=int)
+WARM_POLLS_BUDGET = config('WARM_POLLS_BUDGET', default=10.0, cast=float)
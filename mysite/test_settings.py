@@ -0,0 +1,20 @@
+"""Settings profile for test runs and benchmarks, on throwaway databases.
+
+    python manage.py test polls --settings=mysite.test_settings
+    python manage.py migrate --settings=mysite.test_settings
+
+Never point it at the real databases: Django re-hashes a password with
+the preferred hasher at login, so the fast hasher would replace the
+PBKDF2 hashes of real users.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, VOTE_DATABASES
+
+RETIRED_VOTE_DATABASES = []
+
+# The sharding tests turn votes0 and votes1 on with VOTE_DATABASES.
+DATABASES = {alias: {**DATABASES["default"], "NAME": BASE_DIR / f"scratch-{alias}.sqlite3"}
+             for alias in dict.fromkeys(["default", *VOTE_DATABASES, "votes0", "votes1"])}
+
+# PBKDF2 is deliberately slow, which only costs time here.
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
@@ -13,12 +13,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 
 urlpatterns = [
     path('', include('polls.urls')),
-    path("admin/", admin.site.urls),
-    path('accounts/', include('django.contrib.auth.urls'))
 ]
+
+# admin and accounts are only imported when enabled
+if settings.ENABLE_ADMIN:
+    from django.contrib import admin
+    urlpatterns.append(path("admin/", admin.site.urls))
+
+if settings.ENABLE_ACCOUNTS:
+    urlpatterns.append(path('accounts/', include('django.contrib.auth.urls')))
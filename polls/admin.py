@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Question, Choice
+from .models import Ballot, Question, Choice
 
 admin.site.register(Question)
 admin.site.register(Choice)
+admin.site.register(Ballot)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PollsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "polls"
+
+    def ready(self):
+        # connect the signal receivers
+        from . import caching, middleware, sharding  # noqa: F401
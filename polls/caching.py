@@ -0,0 +1,119 @@
+"""HTTP caching of poll pages for anonymous visitors.
+
+Pages are validated with an ETag and Last-Modified derived from
+``Question.modified``, which is touched whenever a choice changes.
+The results page also uses the question's ``VoteStamp``, which is kept
+with the votes, so voting never writes to the default database.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Question, Choice, VoteStamp
+
+
+def is_anonymous_page(request):
+    """Return True if the page is the same for every anonymous visitor."""
+    return (not request.user.is_authenticated
+            and not len(messages.get_messages(request)))
+
+
+def _make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _index_state(request):
+    """Return (etag, last modified) of the index page, computed once per request."""
+    if not hasattr(request, '_polls_index_state'):
+        now = timezone.now()
+        rows = list(Question.objects.filter(pub_date__lte=now)
+                    .order_by('-pub_date')
+                    .values_list('id', 'modified', 'pub_date', 'end_date')[:5])
+        changes = []
+        states = []
+        for pk, modified, pub_date, end_date in rows:
+            changes += [modified, pub_date]
+            if end_date is not None and end_date < now:
+                # the vote link disappeared when voting ended
+                changes.append(end_date)
+            states.append((pk, modified, end_date is None or now <= end_date))
+        last_modified = max(changes) if changes else None
+        request._polls_index_state = (_make_etag('index', states), last_modified)
+    return request._polls_index_state
+
+
+def index_etag(request, *args, **kwargs):
+    """Return the ETag of the index page."""
+    return _index_state(request)[0]
+
+
+def index_last_modified(request, *args, **kwargs):
+    """Return the last time the index page changed."""
+    return _index_state(request)[1]
+
+
+def _results_state(request, pk):
+    """Return (question modified, votes modified) of a published question, or None."""
+    if not hasattr(request, '_polls_results_state'):
+        modified = (Question.objects.filter(pk=pk, pub_date__lte=timezone.now())
+                    .values_list('modified', flat=True).first())
+        request._polls_results_state = modified and (
+            modified, VoteStamp.objects.for_question(pk).values_list('modified', flat=True).first())
+    return request._polls_results_state
+
+
+def results_etag(request, pk, *args, **kwargs):
+    """Return the ETag of the results page, or None if it is not published."""
+    state = _results_state(request, pk)
+    return state and _make_etag('results', pk, *state)
+
+
+def results_last_modified(request, pk, *args, **kwargs):
+    """Return the last time the question or its votes changed."""
+    state = _results_state(request, pk)
+    return state and max(modified for modified in state if modified)
+
+
+def anonymous_condition(etag_func=None, last_modified_func=None):
+    """Make a view cacheable and conditional for anonymous visitors only.
+
+    Anonymous visitors get ETag/Last-Modified, public Cache-Control and a 304
+    for an up-to-date If-None-Match or If-Modified-Since.
+    Logged in visitors always get a fresh, private response.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func, last_modified_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if is_anonymous_page(request):
+                response = conditional_view(request, *args, **kwargs)
+                if response.status_code in (200, 304):
+                    patch_cache_control(response, public=True,
+                                        max_age=settings.POLLS_CACHE_MAX_AGE)
+            else:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return inner
+    return decorator
+
+
+def touch_questions(question_ids):
+    """Mark questions as modified."""
+    Question.objects.filter(pk__in=list(question_ids)).update(modified=timezone.now())
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def touch_question_of_choice(sender, instance, **kwargs):
+    """Mark the question as modified when one of its choices changes."""
+    touch_questions([instance.question_id])
@@ -0,0 +1,58 @@
+"""Measure vote throughput with concurrent writers on different questions."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from polls.models import Question, Choice, Vote, VoteStamp, vote_database
+
+
+class Command(BaseCommand):
+    """Vote concurrently, one thread per question, and report votes per second.
+
+    Run it with and without VOTE_SHARDS to compare the storage modes.
+    The questions, choices, user and votes it creates are deleted afterwards.
+    """
+
+    help = "Benchmark concurrent voting on different questions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=200, help="votes per thread")
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        questions = [Question.objects.create(question_text=f"Benchmark {n}", pub_date=timezone.now())
+                     for n in range(options['threads'])]
+        choices = [Choice.objects.create(question=question, choice_text="Yes")
+                   for question in questions]
+
+        def write_votes(choice):
+            errors = 0
+            try:
+                for _ in range(options['votes']):
+                    try:
+                        # the writes of a vote request
+                        with transaction.atomic(using=vote_database(choice.question_id)):
+                            Vote.objects.create(user=user, question_id=choice.question_id, choice=choice)
+                            VoteStamp.objects.touch([choice.question_id])
+                    except OperationalError:
+                        # database is locked
+                        errors += 1
+            finally:
+                connections.close_all()
+            return errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            errors = sum(executor.map(write_votes, choices))
+        elapsed = time.perf_counter() - start
+        written = options['threads'] * options['votes'] - errors
+        self.stdout.write(f"{written} votes in {elapsed:.2f}s "
+                          f"({written / elapsed:.0f} votes/s), {errors} failed writes")
+        for question in questions:
+            question.delete()
+        user.delete()
@@ -0,0 +1,34 @@
+"""Report the cold start time of the WSGI or ASGI application."""
+from django.core.management.base import BaseCommand
+
+from polls.startup import profile
+
+
+class Command(BaseCommand):
+    """Boot mysite.wsgi or mysite.asgi in a new interpreter and report each phase."""
+
+    help = "Report import time and first request latency of mysite.wsgi or mysite.asgi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', nargs='?', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--path', default='/polls/', help="path of the first request")
+        parser.add_argument('--no-request', action='store_true', help="only measure the boot")
+        parser.add_argument('--imports', type=int, default=0, metavar='N',
+                            help="also list the N slowest imports")
+
+    def handle(self, *args, **options):
+        path = '' if options['no_request'] else options['path']
+        result, imports = profile(options['target'], path, importtime=bool(options['imports']))
+        self.stdout.write(f"Cold start of mysite.{result['target']}:")
+        for phase, seconds in result['phases'].items():
+            self.stdout.write(f"  {phase:<24}{seconds * 1000:8.1f} ms")
+        if 'status' in result:
+            self.stdout.write(f"  (first request to {path} returned {result['status']})")
+        self.stdout.write(f"  {'boot':<24}{result['boot'] * 1000:8.1f} ms")
+        self.stdout.write(f"  {'total':<24}{result['total'] * 1000:8.1f} ms")
+        loaded = [name for name, is_loaded in result['loaded'].items() if is_loaded]
+        self.stdout.write(f"Optional subsystems loaded: {', '.join(loaded) or 'none'}")
+        if imports:
+            self.stdout.write(f"Slowest {options['imports']} imports (cumulative):")
+            for seconds, module in imports[:options['imports']]:
+                self.stdout.write(f"  {seconds * 1000:8.1f} ms  {module}")
@@ -0,0 +1,28 @@
+"""Create many users at once for seeding and benchmarks."""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Bulk create users that share one pre-hashed password."""
+
+    help = "Create COUNT users named PREFIX1, PREFIX2, ... with the same password."
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--prefix', default='user')
+        parser.add_argument('--password', default='hackme22')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        # hash once, every user gets the same hash (and salt)
+        password = make_password(options['password'])
+        existing = set(User.objects.filter(username__startswith=prefix)
+                       .values_list('username', flat=True))
+        users = [User(username=f'{prefix}{n}', password=password)
+                 for n in range(1, options['count'] + 1)
+                 if f'{prefix}{n}' not in existing]
+        User.objects.bulk_create(users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {len(users)} users."))
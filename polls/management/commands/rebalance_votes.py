@@ -0,0 +1,29 @@
+"""Move votes to the database that stores the votes of their question."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls.models import Vote, vote_database
+from polls.sharding import move_votes, vote_storage
+
+
+class Command(BaseCommand):
+    """Move every vote to the database chosen by VOTE_SHARDS."""
+
+    help = "Move votes between the default and vote databases after changing VOTE_SHARDS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        misplaced = set()
+        for alias in vote_storage():
+            question_ids = Vote.objects.using(alias).order_by() \
+                .values_list('question_id', flat=True).distinct()
+            misplaced.update(question_id for question_id in question_ids
+                             if vote_database(question_id) != alias)
+        moved = sum(move_votes(question_id, options['batch_size'])
+                    for question_id in sorted(misplaced))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} votes of {len(misplaced)} questions."))
+        for alias in settings.RETIRED_VOTE_DATABASES:
+            self.stdout.write(f"{settings.DATABASES[alias]['NAME']} holds no votes any more and can be deleted.")
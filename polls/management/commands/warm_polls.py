@@ -0,0 +1,32 @@
+"""Warm up caches after a deploy."""
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls.warmup import warm
+
+
+class Command(BaseCommand):
+    """Cache the popular polls in the shared cache."""
+
+    help = ("Cache the index and results of the most voted open questions. "
+            "Skipped when the cache is local to this process.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.WARM_POLLS_LIMIT,
+                            help="number of most voted open questions to warm")
+        parser.add_argument('--budget', type=float, default=settings.WARM_POLLS_BUDGET,
+                            help="seconds to spend, tasks not started by then are cancelled")
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        report = warm(options['limit'], options['budget'], options['workers'])
+        for name, status, outcome, seconds in report:
+            timing = "" if seconds is None else f" ({seconds * 1000:.0f} ms)"
+            self.stdout.write(f"{name}: {status}, {outcome}{timing}")
+        counts = Counter(status for _, status, _, _ in report)
+        style = self.style.WARNING if counts['failed'] or counts['unfinished'] else self.style.SUCCESS
+        self.stdout.write(style(f"Warmed {counts['ok']} of {len(report)} tasks, "
+                                f"{counts['skipped']} skipped, {counts['failed']} failed, "
+                                f"{counts['unfinished']} unfinished."))
@@ -0,0 +1,102 @@
+"""Middleware of the polls application."""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.middleware.cache import UpdateCacheMiddleware, FetchFromCacheMiddleware
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .caching import is_anonymous_page
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def user_cache_key(user_id):
+    """Return the cache key of the user with the given id."""
+    return f'polls:auth-user:{user_id}'
+
+
+def _cached_fields():
+    # the password hash is left out, the session auth hash is cached instead
+    return [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+
+def cache_user(user):
+    """Cache the fields of a user that requests need, without its password hash."""
+    names = _cached_fields()
+    cache.set(user_cache_key(user.pk), {
+        'db': user._state.db,
+        'values': [getattr(user, name) for name in names],
+        'session_auth_hash': user.get_session_auth_hash(),
+    }, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def get_cached_user(request):
+    """Return the user of the request session, using the cache when possible.
+
+    The cached user is still checked against the session auth hash, so
+    changing the password logs out other sessions as usual, as long as
+    every worker shares the cache that the change invalidates.
+    Its password is deferred: it is loaded from the database if used,
+    and saving the user leaves it unchanged.
+    """
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+    cached = cache.get(user_cache_key(user_id))
+    if cached is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache_user(user)
+        return user
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if session_hash and constant_time_compare(session_hash, cached['session_auth_hash']):
+        return User.from_db(cached['db'], _cached_fields(), cached['values'])
+    return auth.get_user(request)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """Authentication middleware that caches the user for read-only requests.
+
+    Requests that may change data still load the user from the database.
+    """
+
+    def process_request(self, request):
+        """Attach a lazily loaded user to the request."""
+        super().process_request(request)
+        if request.method in SAFE_METHODS and settings.AUTH_USER_CACHE_TIMEOUT:
+            request.user = SimpleLazyObject(lambda: get_cached_user(request))
+
+
+class AnonymousUpdateCacheMiddleware(UpdateCacheMiddleware):
+    """Per-site cache middleware that only stores pages of anonymous visitors."""
+
+    def _should_update_cache(self, request, response):
+        return (super()._should_update_cache(request, response)
+                and not request.user.is_authenticated)
+
+
+class AnonymousFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    """Per-site cache middleware that only serves cached pages to anonymous visitors."""
+
+    def process_request(self, request):
+        """Serve the cached page unless the page may differ for this visitor."""
+        if not is_anonymous_page(request):
+            request._cache_update_cache = False
+            return None
+        return super().process_request(request)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached copy of a user when it is changed or deleted."""
+    cache.delete(user_cache_key(instance.pk))
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-19 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0004_remove_choice_votes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="modified",
+            field=models.DateTimeField(auto_now=True, verbose_name="date modified"),
+        ),
+    ]
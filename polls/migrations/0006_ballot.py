@@ -0,0 +1,39 @@
+# Generated by Django 4.1 on 2026-10-19 09:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0005_question_modified"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Ballot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("title", models.CharField(max_length=200)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="question",
+            name="ballot",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="polls.ballot",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1 on 2026-10-19 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0006_ballot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("single", "Single choice"),
+                    ("approval", "Multiple choices (approval)"),
+                    ("ranked", "Ranked choices (instant runoff)"),
+                ],
+                default="single",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="rank",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.1 on 2026-10-19 09:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_vote_question(apps, schema_editor):
+    Choice = apps.get_model("polls", "Choice")
+    Vote = apps.get_model("polls", "Vote")
+    Vote.objects.using(schema_editor.connection.alias).update(
+        question_id=models.Subquery(
+            Choice.objects.filter(pk=models.OuterRef("choice_id")).values("question_id")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("polls", "0007_question_kind_vote_rank"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.question",
+            ),
+        ),
+        migrations.RunPython(
+            fill_vote_question,
+            migrations.RunPython.noop,
+            hints={"model_name": "choice"},
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.question",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="choice",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.choice",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="user",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
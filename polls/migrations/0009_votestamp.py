@@ -0,0 +1,30 @@
+# Generated by Django 4.1 on 2026-10-19 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0008_vote_question"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteStamp",
+            fields=[
+                (
+                    "question",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="polls.question",
+                    ),
+                ),
+                ("modified", models.DateTimeField(verbose_name="date votes modified")),
+            ],
+        ),
+    ]
@@ -1,17 +1,45 @@
 """The models module provides the core objects of polls app(Question and Choice)."""
 import datetime
 
-from django.db import models
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+class Ballot(models.Model):
+    """A Ballot groups related questions that are answered in one form."""
+
+    title = models.CharField(max_length=200)
+
+    def __str__(self):
+        """Show the ballot title."""
+        return self.title
+
+    def open_questions(self):
+        """Return the questions of this ballot that can be voted, with their choices."""
+        questions = self.question_set.order_by('id').prefetch_related('choice_set')
+        return [question for question in questions if question.can_vote()]
+
+
 class Question(models.Model):
     """A Question class create questions with published date and end date."""
 
+    SINGLE = 'single'
+    APPROVAL = 'approval'
+    RANKED = 'ranked'
+    KIND_CHOICES = [
+        (SINGLE, 'Single choice'),
+        (APPROVAL, 'Multiple choices (approval)'),
+        (RANKED, 'Ranked choices (instant runoff)'),
+    ]
+
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('date ended', null=True)
+    modified = models.DateTimeField('date modified', auto_now=True)
+    ballot = models.ForeignKey(Ballot, on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=SINGLE)
 
     def __str__(self):
         """Show the question text."""
@@ -39,10 +67,24 @@ class Question(models.Model):
 
     def get_voted_choice(self, user):
         """Get the choice that is already voted."""
-        for choice in self.choice_set.all():
-            if Vote.objects.filter(choice=choice, user=user).exists():
-                return choice
-        return None
+        choice_id = Vote.objects.for_question(self.pk).filter(user=user) \
+            .values_list('choice_id', flat=True).first()
+        if choice_id is None:
+            return None
+        return self.choice_set.filter(pk=choice_id).first()
+
+    def get_voted_ranks(self, user):
+        """Return a dict of choice id to rank (or None) of the user's votes."""
+        return Vote.objects.ranks_of_user(user, [self.pk]).get(self.pk, {})
+
+    def get_vote_counts(self):
+        """Return a dict of choice id to number of votes, counted in one query."""
+        return dict(Vote.objects.for_question(self.pk).order_by()
+                    .values_list('choice_id').annotate(models.Count('id')))
+
+    def votes_modified(self):
+        """Return the last time the votes of this question changed, or None."""
+        return VoteStamp.objects.for_question(self.pk).values_list('modified', flat=True).first()
 
 
 class Choice(models.Model):
@@ -58,10 +100,101 @@ class Choice(models.Model):
     @property
     def votes(self):
         """Count the number of votes for this choice."""
-        return Vote.objects.filter(choice=self).count()
+        return Vote.objects.for_question(self.question_id).filter(choice=self).count()
+
+
+def vote_database(question_id):
+    """Return the alias of the database that stores the votes of a question.
+
+    Votes stay in the default database unless VOTE_DATABASES lists shards.
+    """
+    shards = settings.VOTE_DATABASES
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[question_id % len(shards)]
+
+
+def group_by_vote_database(question_ids):
+    """Return a dict of database alias to the given question ids whose votes it stores."""
+    by_database = {}
+    for question_id in question_ids:
+        by_database.setdefault(vote_database(question_id), []).append(question_id)
+    return by_database
+
+
+class VoteDatabaseQuerySet(models.QuerySet):
+    """Querysets of objects kept in the database of their question's votes."""
+
+    def for_question(self, question_id):
+        """Return the objects of a question, from the database that stores them."""
+        return self.using(vote_database(question_id)).filter(question_id=question_id)
+
+    def for_questions(self, question_ids):
+        """Return a list of querysets, one per database, of the objects of several questions."""
+        return [self.using(alias).filter(question_id__in=ids)
+                for alias, ids in group_by_vote_database(question_ids).items()]
+
+
+class VoteQuerySet(VoteDatabaseQuerySet):
+    """Querysets of votes routed to the database of their question."""
+
+    def create(self, **kwargs):
+        """Create a vote in the database of its question."""
+        vote = self.model(**kwargs)
+        # without an explicit database, save() asks the router with the vote as hint
+        vote.save(force_insert=True, using=self._db)
+        return vote
+
+    def ranks_of_user(self, user, question_ids):
+        """Return a dict of question id to {choice id: rank or None} of a user's votes."""
+        ranks = {}
+        for votes in self.for_questions(question_ids):
+            for question_id, choice_id, rank in (votes.filter(user=user)
+                                                 .values_list('question_id', 'choice_id', 'rank')):
+                ranks.setdefault(question_id, {})[choice_id] = rank
+        return ranks
 
 
 class Vote(models.Model):
-    """A vote by a user for a question."""
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    """A vote by a user for a question.
+
+    Ranked questions have one vote per ranked choice, rank 1 being the first preference.
+    """
+    # no database constraints, votes may be stored in another database
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, db_constraint=False)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, db_constraint=False)
+    rank = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    objects = VoteQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """Save the vote, taking the question from the choice if it is not set."""
+        if self.question_id is None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
+
+class VoteStampQuerySet(VoteDatabaseQuerySet):
+    """Querysets of vote stamps routed to the database of their question's votes."""
+
+    def touch(self, question_ids):
+        """Record that the votes of questions changed now, in the databases of their votes."""
+        now = timezone.now()
+        for alias, ids in group_by_vote_database(question_ids).items():
+            self.using(alias).bulk_create(
+                [self.model(question_id=question_id, modified=now) for question_id in ids],
+                update_conflicts=True, unique_fields=['question_id'], update_fields=['modified'])
+
+
+class VoteStamp(models.Model):
+    """The last time the votes of a question changed.
+
+    It is stored next to the votes, so recording a vote only writes to
+    the database of its question. It validates the results of the question.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True,
+                                    db_constraint=False)
+    modified = models.DateTimeField('date votes modified')
+
+    objects = VoteStampQuerySet.as_manager()
@@ -0,0 +1,116 @@
+"""Storage of votes in several databases, keyed on question id.
+
+Set VOTE_SHARDS in .env to the number of vote databases, then run
+``python manage.py migrate --database votes<n>`` for each of them and
+``python manage.py rebalance_votes`` to move the existing votes. The
+votes of vote databases left from a higher VOTE_SHARDS are moved too.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Question, Choice, Vote, VoteStamp, vote_database
+
+VOTE_MODELS = (Vote, VoteStamp)
+
+
+class VoteShardRouter:
+    """Route votes and their stamps to the database of their question."""
+
+    def _database_for(self, model, instance):
+        if model not in VOTE_MODELS:
+            # users, questions and choices of a vote are always in the default database
+            return DEFAULT_DB_ALIAS if isinstance(instance, VOTE_MODELS) else None
+        if isinstance(instance, (*VOTE_MODELS, Choice)):
+            return vote_database(instance.question_id)
+        if isinstance(instance, Question):
+            return vote_database(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        """Read votes from the database of their question."""
+        return self._database_for(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        """Write votes to the database of their question."""
+        return self._database_for(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow votes to refer to users, questions and choices in another database."""
+        if isinstance(obj1, VOTE_MODELS) or isinstance(obj2, VOTE_MODELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only create the vote and vote stamp tables in the vote databases."""
+        if db in settings.VOTE_DATABASES or db in settings.RETIRED_VOTE_DATABASES:
+            return app_label == 'polls' and model_name in ('vote', 'votestamp')
+        return None
+
+
+def vote_storage():
+    """Return the aliases of every database that may hold votes, retired ones included."""
+    return [DEFAULT_DB_ALIAS, *settings.VOTE_DATABASES, *settings.RETIRED_VOTE_DATABASES]
+
+
+def move_votes(question_id, batch_size=1000):
+    """Move the votes of a question to its database, return how many were moved.
+
+    Each batch is committed to the target before it is deleted from the
+    source. If the delete fails, a new run skips the copies already made.
+    """
+    target = vote_database(question_id)
+    moved = 0
+    for source in vote_storage():
+        if source == target:
+            continue
+        while True:
+            votes = list(Vote.objects.using(source).filter(question_id=question_id)
+                         .order_by('id')[:batch_size])
+            if not votes:
+                break
+            with transaction.atomic(using=target):
+                copied = set(Vote.objects.using(target)
+                             .filter(question_id=question_id, user_id__in={vote.user_id for vote in votes})
+                             .values_list('user_id', 'choice_id'))
+                # ids are only unique within one database, so let the target assign them
+                Vote.objects.using(target).bulk_create(
+                    [Vote(user_id=vote.user_id, question_id=vote.question_id,
+                          choice_id=vote.choice_id, rank=vote.rank)
+                     for vote in votes if (vote.user_id, vote.choice_id) not in copied])
+                VoteStamp.objects.touch([question_id])
+            # no signal receivers on votes, so this is a single DELETE
+            Vote.objects.using(source).filter(id__in=[vote.id for vote in votes]).delete()
+            moved += len(votes)
+        VoteStamp.objects.using(source).filter(question_id=question_id).delete()
+    return moved
+
+
+@receiver(post_delete, sender=Question)
+def delete_question_votes(sender, instance, **kwargs):
+    """Delete the votes of a deleted question that are kept in a vote database."""
+    if settings.VOTE_DATABASES:
+        Vote.objects.for_question(instance.pk).delete()
+        VoteStamp.objects.for_question(instance.pk).delete()
+
+
+@receiver(post_delete, sender=Choice)
+def delete_choice_votes(sender, instance, **kwargs):
+    """Delete the votes of a deleted choice that are kept in a vote database."""
+    if settings.VOTE_DATABASES:
+        with transaction.atomic(using=vote_database(instance.question_id)):
+            Vote.objects.for_question(instance.question_id).filter(choice_id=instance.pk).delete()
+            VoteStamp.objects.touch([instance.question_id])
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_votes(sender, instance, **kwargs):
+    """Delete the votes of a user about to be deleted, from every database that stores votes."""
+    for alias in [DEFAULT_DB_ALIAS, *settings.VOTE_DATABASES]:
+        with transaction.atomic(using=alias):
+            votes = Vote.objects.using(alias).filter(user_id=instance.pk)
+            question_ids = set(votes.values_list('question_id', flat=True))
+            votes.delete()
+            VoteStamp.objects.touch(question_ids)
@@ -0,0 +1,128 @@
+"""Measure the cold start of mysite.wsgi or mysite.asgi, phase by phase.
+
+Run as ``python -m polls.startup wsgi`` in a fresh interpreter, it prints
+the timings as JSON. Use ``manage.py profile_startup`` for a report.
+"""
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SUBSYSTEMS = ['django.contrib.admin', 'django.contrib.auth.views', 'django.contrib.messages.middleware']
+
+
+def wsgi_request(application, path, host):
+    """Send a GET request for path to a WSGI application, return the status code."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    body = application(environ, lambda status, headers: statuses.append(status))
+    b''.join(body)
+    return int(statuses[0].split()[0])
+
+
+def asgi_request(application, path, host):
+    """Send a GET request for path to an ASGI application, return the status code."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'headers': [(b'host', host.encode())],
+        'client': ('127.0.0.1', 0), 'server': (host, 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return messages[0]['status']
+
+
+def measure(target='wsgi', path='/polls/'):
+    """Boot mysite.<target> in this interpreter and return the timings in seconds.
+
+    Only meaningful in a fresh interpreter, as modules imported before are not counted.
+    If path is empty, no first request is made.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    phases = {}
+    start = last = time.perf_counter()
+
+    def lap(name):
+        nonlocal last
+        now = time.perf_counter()
+        phases[name] = now - last
+        last = now
+
+    from django.conf import settings
+    settings.INSTALLED_APPS
+    lap('settings')
+    import django
+    django.setup(set_prefix=False)
+    lap('app registry')
+    from importlib import import_module
+    application = import_module(f'mysite.{target}').application
+    lap('handler and middleware')
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    lap('urlconf')
+    from django.template.loader import get_template
+    for name in ('polls/index.html', 'polls/detail.html', 'polls/results.html'):
+        get_template(name)
+    lap('templates')
+    from django.contrib.staticfiles import finders
+    from django.templatetags.static import static
+    finders.get_finders()
+    static('polls/style.css')
+    lap('static files')
+    result = {'target': target, 'phases': phases, 'boot': last - start}
+    if path:
+        host = 'testserver'
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, host]
+        request = asgi_request if target == 'asgi' else wsgi_request
+        result['status'] = request(application, path, host)
+        lap('first request')
+    result['total'] = last - start
+    result['loaded'] = {name: name in sys.modules for name in SUBSYSTEMS}
+    return result
+
+
+def profile(target='wsgi', path='/polls/', env=None, importtime=False):
+    """Measure a cold start in a new interpreter, return (timings, import times).
+
+    env adds environment variables, e.g. settings for decouple.
+    With importtime, import times is a list of (cumulative seconds, module),
+    slowest first; otherwise it is empty.
+    """
+    command = [sys.executable, '-m', 'polls.startup', target, path]
+    if importtime:
+        command[1:1] = ['-X', 'importtime']
+    completed = subprocess.run(command, cwd=Path(__file__).resolve().parent.parent,
+                               env={**os.environ, **(env or {})},
+                               capture_output=True, text=True, check=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('package'):
+            _, cumulative, module = line[len('import time:'):].split('|')
+            imports.append((int(cumulative) / 1e6, module.strip()))
+    imports.sort(reverse=True)
+    return json.loads(completed.stdout), imports
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else 'wsgi'
+    path = sys.argv[2] if len(sys.argv) > 2 else '/polls/'
+    # keep the report on stdout clean of anything the app prints
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    result = measure(target, path)
+    stdout.write(json.dumps(result))
@@ -0,0 +1,105 @@
+"""Tally of the votes of questions, and of ranked-choice questions by instant runoff."""
+from collections import Counter, namedtuple
+from itertools import groupby
+
+from django.core.cache import cache
+
+from .models import Vote
+
+Round = namedtuple('Round', ['counts', 'exhausted', 'eliminated'])
+Round.__doc__ = """One round of an instant runoff.
+
+counts maps each remaining choice id to its number of ballots,
+exhausted is the number of ballots with no remaining choice and
+eliminated is the list of choice ids dropped after this round.
+"""
+
+
+def instant_runoff(ballots, candidates=()):
+    """Run an instant runoff and return (rounds, winner).
+
+    ballots is an iterable of sequences of choice ids, most preferred first.
+    It is read once, so it can be a generator over millions of ballots.
+    Identical ballots are counted together and kept in piles by their
+    current top choice; a round only moves the piles of eliminated choices.
+    All choices tied for fewest ballots are eliminated together.
+    The winner is None when the last remaining choices are tied,
+    including when there are no ballots.
+    """
+    piles = {candidate: Counter() for candidate in candidates}
+    for ballot, count in Counter(tuple(ballot) for ballot in ballots if ballot).items():
+        for candidate in ballot:
+            piles.setdefault(candidate, Counter())
+        piles[ballot[0]][ballot, 0] += count
+    counts = {candidate: sum(pile.values()) for candidate, pile in piles.items()}
+    exhausted = 0
+    rounds = []
+    while counts:
+        active = sum(counts.values())
+        leader = max(counts, key=counts.get)
+        if counts[leader] and (counts[leader] * 2 > active or len(counts) == 1):
+            rounds.append(Round(dict(counts), exhausted, []))
+            return rounds, leader
+        fewest = min(counts.values())
+        losers = [candidate for candidate, count in counts.items() if count == fewest]
+        rounds.append(Round(dict(counts), exhausted, losers))
+        if len(losers) == len(counts):
+            return rounds, None
+        exhausted += _eliminate(piles, counts, losers)
+    return rounds, None
+
+
+def _eliminate(piles, counts, losers):
+    """Drop the losers and move their piles to the next remaining choice of each ballot.
+
+    Return the number of ballots left with no remaining choice.
+    """
+    exhausted = 0
+    for loser in losers:
+        del counts[loser]
+    for loser in losers:
+        for (ballot, position), count in piles.pop(loser).items():
+            for next_position in range(position + 1, len(ballot)):
+                candidate = ballot[next_position]
+                if candidate in counts:
+                    piles[candidate][ballot, next_position] += count
+                    counts[candidate] += count
+                    break
+            else:
+                exhausted += count
+    return exhausted
+
+
+def ranked_ballots(question):
+    """Yield the ballots of a ranked question, streamed from a single query."""
+    votes = (Vote.objects.for_question(question.pk).filter(rank__isnull=False)
+             .order_by('user_id', 'rank')
+             .values_list('user_id', 'choice_id')
+             .iterator(chunk_size=5000))
+    for _, user_votes in groupby(votes, key=lambda vote: vote[0]):
+        yield [choice_id for _, choice_id in user_votes]
+
+
+def _cached(question, name, compute):
+    """Return compute(), cached until the question or its votes are modified."""
+    votes_modified = question.votes_modified()
+    key = (f'polls:{name}:{question.pk}:{question.modified.timestamp()}:'
+           f'{votes_modified and votes_modified.timestamp()}')
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result)
+    return result
+
+
+def question_vote_counts(question):
+    """Return a dict of choice id to number of votes, cached until the question or its votes change."""
+    return _cached(question, 'counts', question.get_vote_counts)
+
+
+def question_runoff(question):
+    """Return (rounds, winner) of a ranked question, cached until it or its votes change."""
+    def compute():
+        candidates = question.choice_set.values_list('id', flat=True)
+        return instant_runoff(ranked_ballots(question), candidates)
+    return _cached(question, 'runoff', compute)
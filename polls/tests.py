@@ -1,13 +1,34 @@
 """Unit tests for polls application."""
 import datetime
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
+import django.conf
 import django.test
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Question, Choice
+from .middleware import user_cache_key
+from .models import Ballot, Question, Choice, Vote, VoteQuerySet, VoteStamp, vote_database
+from .views import replace_votes
+from .tally import instant_runoff, question_runoff, question_vote_counts
+from .sharding import VoteShardRouter
+from .startup import profile
+from .warmup import most_voted_open_questions, warm_in_background
 
 
 class QuestionModelTests(TestCase):
@@ -311,3 +332,690 @@ class UserAuthTest(django.test.TestCase):
         self.assertEqual(response.status_code, 302)  # could be 303
         login_with_next = f"{reverse('login')}?next={vote_url}"
         self.assertRedirects(response, login_with_next)
+
+
+class ProvisionUsersTest(TestCase):
+    """Test cases for the provision_users command."""
+
+    def test_creates_users_with_usable_password(self):
+        """All created users can log in with the given password."""
+        call_command('provision_users', 20, prefix='bench', password='FatChance!', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='bench').count(), 20)
+        self.assertTrue(self.client.login(username='bench20', password='FatChance!'))
+
+    def test_skips_existing_users(self):
+        """Running the command again does not fail on existing usernames."""
+        call_command('provision_users', 5, prefix='bench', stdout=StringIO())
+        call_command('provision_users', 8, prefix='bench', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='bench').count(), 8)
+
+
+@override_settings(AUTH_USER_CACHE_TIMEOUT=300)
+class CachedAuthenticationTest(TestCase):
+    """Test cases for caching the logged in user."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+        self.client.force_login(self.user)
+        create_question("First Poll Question")
+
+    def test_user_is_cached_on_read_only_pages(self):
+        """The user is not queried again once it has been cached."""
+        url = reverse('polls:index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([q for q in queries if 'auth_user' in q['sql']])
+        self.assertContains(response, "testuser")
+
+    def test_changing_password_logs_out_cached_user(self):
+        """A cached user is still checked against the session auth hash."""
+        self.client.get(reverse('polls:index'))
+        self.user.set_password("NewPassword!")
+        self.user.save()
+        response = self.client.get(reverse('polls:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_password_hash_is_not_cached(self):
+        """The cache holds no password hash, and saving a cached user keeps the password."""
+        response = self.client.get(reverse('polls:index'))
+        response = self.client.get(reverse('polls:index'))
+        self.assertNotIn(self.user.password, str(cache.get(user_cache_key(self.user.pk))))
+        cached_user = response.wsgi_request.user
+        cached_user.first_name = "Test"
+        cached_user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password("FatChance!"))
+
+
+class StaticFilesTest(TestCase):
+    """Test cases for the production static files setup."""
+
+    def test_collectstatic_hashes_and_compresses(self):
+        """collectstatic writes hashed, precompressed files and rewrites CSS urls."""
+        with tempfile.TemporaryDirectory() as static_root:
+            with override_settings(
+                    STATIC_ROOT=static_root,
+                    STATICFILES_STORAGE="whitenoise.storage.CompressedManifestStaticFilesStorage"):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                css_name = staticfiles_storage.stored_name('polls/style.css')
+                self.assertNotEqual(css_name, 'polls/style.css')
+                self.assertTrue(staticfiles_storage.exists(css_name + '.gz'))
+                self.assertTrue(staticfiles_storage.exists(css_name + '.br'))
+                with staticfiles_storage.open(css_name) as css:
+                    content = css.read().decode()
+                self.assertIn(staticfiles_storage.stored_name('polls/images/bg-768.webp')
+                              .rsplit('/', 1)[-1], content)
+                response = self.client.get(reverse('polls:index'))
+                self.assertContains(response, css_name)
+
+
+class AnonymousHttpCachingTest(TestCase):
+    """Test cases for cache headers and conditional responses."""
+
+    def setUp(self):
+        self.question = create_question("First Poll Question", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+
+    def test_anonymous_pages_are_public(self):
+        """Anonymous index and results pages carry validators and public caching."""
+        for url in (reverse('polls:index'), reverse('polls:results', args=(self.question.id,))):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_if_none_match_returns_304(self):
+        """An up-to-date ETag gets a 304 response."""
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_returns_304(self):
+        """An up-to-date If-Modified-Since gets a 304 response."""
+        url = reverse('polls:index')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_results_etag(self):
+        """A new vote makes the old ETag stale."""
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.client.logout()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_vote_leaves_question_and_choices_alone(self):
+        """Changing a vote writes the votes and their stamp, not the question or choices."""
+        other = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        Vote.objects.create(user=self.user, choice=other)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 3, writes)
+        self.assertFalse([sql for sql in writes if 'polls_question' in sql or 'polls_choice' in sql])
+
+    def test_authenticated_pages_are_private(self):
+        """Logged in visitors get private responses without validators."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('polls:index'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(MIDDLEWARE=[
+        "polls.middleware.AnonymousUpdateCacheMiddleware",
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.common.CommonMiddleware",
+        "django.middleware.csrf.CsrfViewMiddleware",
+        "polls.middleware.CachedAuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+        "polls.middleware.AnonymousFetchFromCacheMiddleware",
+    ])
+    def test_site_cache_serves_anonymous_only(self):
+        """The per-site cache is used for anonymous visitors but not logged in users."""
+        cache.clear()
+        url = reverse('polls:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertContains(response, "testuser")
+
+
+class BallotTest(TestCase):
+    """Test cases for answering all questions of a ballot at once."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+        self.ballot = Ballot.objects.create(title="Survey")
+        self.questions = []
+        for n in range(1, 11):
+            question = create_question(f"Question {n}", days=-1)
+            question.ballot = self.ballot
+            question.save()
+            for m in range(1, 4):
+                Choice.objects.create(question=question, choice_text=f"Choice {m}")
+            self.questions.append(question)
+        self.url = reverse('polls:vote-ballot', args=(self.ballot.id,))
+
+    def answers(self, index=0):
+        """Return form data choosing the choice at index for every question."""
+        return {f"question{q.id}": q.choice_set.order_by('id')[index].id for q in self.questions}
+
+    def test_ballot_page_shows_all_questions(self):
+        """The ballot page shows every open question of the ballot."""
+        response = self.client.get(reverse('polls:ballot', args=(self.ballot.id,)))
+        for question in self.questions:
+            self.assertContains(response, question.question_text)
+
+    def test_vote_all_questions_in_one_request(self):
+        """One request records a vote for every question with few queries."""
+        self.client.force_login(self.user)
+        data = self.answers()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        # a fixed number of queries, not a few per question
+        self.assertLessEqual(len(queries), 14)
+        self.assertRedirects(response, reverse('polls:ballot', args=(self.ballot.id,)))
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 10)
+
+    def test_change_answers(self):
+        """Submitting again replaces the previous answers."""
+        self.client.force_login(self.user)
+        self.client.post(self.url, self.answers(0))
+        self.client.post(self.url, self.answers(2))
+        votes = Vote.objects.filter(user=self.user)
+        self.assertEqual(votes.count(), 10)
+        self.assertEqual({vote.choice_id for vote in votes}, set(self.answers(2).values()))
+
+    def test_unchanged_answers_are_not_rewritten(self):
+        """Submitting the same answers again writes no votes."""
+        self.client.force_login(self.user)
+        self.client.post(self.url, self.answers())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, self.answers())
+        self.assertFalse([q for q in queries if q['sql'].startswith(('INSERT', 'DELETE'))])
+
+    def test_invalid_choice_records_nothing(self):
+        """A choice from another question rejects the whole ballot."""
+        self.client.force_login(self.user)
+        data = self.answers()
+        data[f"question{self.questions[0].id}"] = data[f"question{self.questions[1].id}"]
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_rejected_ballot_keeps_answers(self):
+        """A rejected ballot is shown again with the submitted answers selected."""
+        self.client.force_login(self.user)
+        self.client.post(self.url, self.answers(0))
+        data = self.answers(2)
+        data[f"question{self.questions[0].id}"] = data[f"question{self.questions[1].id}"]
+        response = self.client.post(self.url, data)
+        selected = {question.id: [choice.id for choice in question.choices if choice.voted]
+                    for question in response.context['questions']}
+        expected = {question.id: [data[f"question{question.id}"]] for question in self.questions[1:]}
+        self.assertEqual(selected, {self.questions[0].id: [], **expected})
+
+    def test_replace_votes_touches_stamps_in_the_transaction(self):
+        """Votes are rolled back if their stamps cannot be updated."""
+        with patch.object(VoteStamp.objects, 'touch', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                replace_votes(self.user, {self.questions[0].id: [(self.questions[0].choice_set.first().id, None)]})
+        self.assertFalse(Vote.objects.exists())
+
+    def test_auth_required_to_vote_ballot(self):
+        """Anonymous visitors are redirected to login."""
+        response = self.client.post(self.url, self.answers())
+        self.assertRedirects(response, f"{reverse('login')}?next={self.url}")
+
+
+class InstantRunoffTest(TestCase):
+    """Test cases for the instant runoff tally engine."""
+
+    def test_majority_in_first_round(self):
+        """A choice with more than half of first preferences wins at once."""
+        rounds, winner = instant_runoff([[1, 2], [1], [2, 1]])
+        self.assertEqual(winner, 1)
+        self.assertEqual(len(rounds), 1)
+
+    def test_transfers_eliminated_votes(self):
+        """Ballots of an eliminated choice move to their next remaining choice."""
+        ballots = [[1]] * 4 + [[2]] * 3 + [[3, 2]] * 2
+        rounds, winner = instant_runoff(ballots)
+        self.assertEqual(rounds[0].eliminated, [3])
+        self.assertEqual(rounds[1].counts, {1: 4, 2: 5})
+        self.assertEqual(winner, 2)
+
+    def test_exhausted_ballots(self):
+        """Ballots without remaining choices are counted as exhausted."""
+        ballots = [[1]] * 4 + [[2]] * 3 + [[3]] * 2
+        rounds, winner = instant_runoff(ballots)
+        self.assertEqual(rounds[1].exhausted, 2)
+        self.assertEqual(winner, 1)
+
+    def test_tie(self):
+        """There is no winner when the last choices are tied."""
+        rounds, winner = instant_runoff([[1], [2]])
+        self.assertIsNone(winner)
+
+    def test_no_ballots_has_no_winner(self):
+        """A single choice nobody voted for does not win."""
+        self.assertIsNone(instant_runoff([], [5])[1])
+        self.assertIsNone(instant_runoff([], [5, 6])[1])
+
+    def test_choices_without_votes_are_eliminated(self):
+        """Candidates nobody ranked are dropped in the first round."""
+        rounds, winner = instant_runoff([[1], [1], [2]], candidates=[1, 2, 3])
+        self.assertEqual(rounds[0].counts[3], 0)
+        self.assertEqual(winner, 1)
+
+    def test_many_ballots_time_and_memory(self):
+        """200,000 streamed ballots are tallied quickly in little memory."""
+        rng = random.Random(1)
+        candidates = list(range(1, 9))
+
+        def ballots():
+            for _ in range(200_000):
+                yield rng.sample(candidates, rng.randint(1, 4))
+        tracemalloc.start()
+        start = time.perf_counter()
+        rounds, winner = instant_runoff(ballots(), candidates)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(sum(rounds[0].counts.values()), 200_000)
+        self.assertLess(elapsed, 10)
+        self.assertLess(peak, 20 * 1024 * 1024)
+
+
+class MultipleChoiceVoteTest(TestCase):
+    """Test cases for approval and ranked questions."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+        self.client.force_login(self.user)
+        self.question = create_question("Favourite?", days=-1)
+        self.choices = [Choice.objects.create(question=self.question, choice_text=f"Choice {n}")
+                        for n in range(1, 4)]
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_approval_vote(self):
+        """An approval vote records every selected choice."""
+        self.question.kind = Question.APPROVAL
+        self.question.save()
+        self.client.post(self.url, {'choice': [self.choices[0].id, self.choices[2].id]})
+        self.assertEqual(self.choices[0].votes, 1)
+        self.assertEqual(self.choices[1].votes, 0)
+        self.assertEqual(self.choices[2].votes, 1)
+
+    def test_ranked_vote_and_results(self):
+        """A ranked vote stores ranks and the results show the runoff."""
+        self.question.kind = Question.RANKED
+        self.question.save()
+        data = {f'choice-rank{self.choices[2].id}': '1', f'choice-rank{self.choices[0].id}': '3'}
+        response = self.client.post(self.url, data)
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.question.get_voted_ranks(self.user),
+                         {self.choices[2].id: 1, self.choices[0].id: 2})
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, "Winner: Choice 3")
+
+    def test_duplicate_ranks_are_rejected(self):
+        """Two choices cannot share a rank."""
+        self.question.kind = Question.RANKED
+        self.question.save()
+        data = {f'choice-rank{self.choices[0].id}': '1', f'choice-rank{self.choices[1].id}': '1'}
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_runoff_is_cached_until_modified(self):
+        """The runoff is recomputed only after the question changes."""
+        cache.clear()
+        self.question.kind = Question.RANKED
+        self.question.save()
+        Vote.objects.create(user=self.user, choice=self.choices[0], rank=1)
+        self.question.refresh_from_db()
+        self.assertEqual(question_runoff(self.question)[1], self.choices[0].id)
+        # only the vote stamp is read
+        with self.assertNumQueries(1):
+            question_runoff(self.question)
+        Vote.objects.filter(user=self.user).update(choice=self.choices[1])
+        self.question.save()
+        self.assertEqual(question_runoff(self.question)[1], self.choices[1].id)
+
+
+@override_settings(VOTE_DATABASES=['votes0', 'votes1'])
+class VoteShardRouterTest(TestCase):
+    """Test cases for routing votes to vote databases."""
+
+    def setUp(self):
+        self.router = VoteShardRouter()
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+        self.question = create_question("Question", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice")
+
+    def test_vote_database_by_question_id(self):
+        """Votes are spread over the vote databases by question id."""
+        self.assertEqual(vote_database(4), 'votes0')
+        self.assertEqual(vote_database(7), 'votes1')
+
+    def test_votes_are_routed_by_their_question(self):
+        """Votes, and the votes of a choice or question, go to the question's database."""
+        vote = Vote(user=self.user, question=self.question, choice=self.choice)
+        database = vote_database(self.question.id)
+        self.assertEqual(self.router.db_for_write(Vote, instance=vote), database)
+        self.assertEqual(self.router.db_for_read(Vote, instance=self.choice), database)
+        self.assertEqual(self.router.db_for_read(Vote, instance=self.question), database)
+
+    def test_objects_of_a_vote_are_in_default_database(self):
+        """The choice and user of a vote are read from the default database."""
+        vote = Vote(user=self.user, question=self.question, choice=self.choice)
+        self.assertEqual(self.router.db_for_read(Choice, instance=vote), 'default')
+        self.assertIsNone(self.router.db_for_read(Choice, instance=self.question))
+
+    def test_only_votes_are_migrated_to_vote_databases(self):
+        """Vote databases only hold the vote table."""
+        self.assertTrue(self.router.allow_migrate('votes0', 'polls', model_name='vote'))
+        self.assertTrue(self.router.allow_migrate('votes0', 'polls', model_name='votestamp'))
+        self.assertFalse(self.router.allow_migrate('votes0', 'polls', model_name='choice'))
+        self.assertFalse(self.router.allow_migrate('votes0', 'auth', model_name='user'))
+        self.assertIsNone(self.router.allow_migrate('default', 'polls', model_name='choice'))
+
+
+VOTE_TEST_DATABASES = {'votes0', 'votes1'} & set(django.conf.settings.DATABASES)
+
+
+@skipUnless(len(VOTE_TEST_DATABASES) == 2, "the vote databases are defined in mysite.test_settings")
+@override_settings(VOTE_DATABASES=['votes0', 'votes1'])
+class ShardedVotesTest(TestCase):
+    """End to end tests of votes stored in two vote databases."""
+
+    databases = {'default', *VOTE_TEST_DATABASES}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="FatChance!")
+        self.questions = [create_question(f"Question {n}", days=-1) for n in range(2)]
+        self.choices = [Choice.objects.create(question=question, choice_text="Choice")
+                        for question in self.questions]
+        self.vote_aliases = [vote_database(question.id) for question in self.questions]
+        self.client.force_login(self.user)
+
+    def vote(self, choice):
+        """Vote for a choice as the logged in user."""
+        return self.client.post(reverse('polls:vote', args=(choice.question_id,)), {'choice': choice.id})
+
+    def test_questions_use_both_databases(self):
+        """The two questions keep their votes in different databases."""
+        self.assertEqual(sorted(self.vote_aliases), ['votes0', 'votes1'])
+
+    def test_vote_only_writes_its_vote_database(self):
+        """A vote is stored with its stamp in its question's database, nothing is written to default."""
+        with CaptureQueriesContext(connection) as queries:
+            self.vote(self.choices[0])
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertEqual(Vote.objects.using(self.vote_aliases[0]).get().choice_id, self.choices[0].id)
+        self.assertFalse(Vote.objects.using(self.vote_aliases[1]).exists())
+        self.assertFalse(Vote.objects.using('default').exists())
+        self.assertTrue(VoteStamp.objects.using(self.vote_aliases[0]).filter(question=self.questions[0]).exists())
+        self.assertEqual(self.choices[0].votes, 1)
+        self.assertEqual(self.questions[0].get_vote_counts(), {self.choices[0].id: 1})
+
+    def test_vote_changes_results_etag(self):
+        """The results page is validated by the vote stamp in the vote database."""
+        url = reverse('polls:results', args=(self.questions[0].id,))
+        self.client.logout()
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        self.vote(self.choices[0])
+        self.client.logout()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['choices'][0].vote_count, 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_replace_votes_in_both_databases(self):
+        """Votes for questions in different databases are replaced in each of them."""
+        second = Choice.objects.create(question=self.questions[1], choice_text="Second")
+        replace_votes(self.user, {self.questions[0].id: [(self.choices[0].id, None)],
+                                  self.questions[1].id: [(self.choices[1].id, None)]})
+        replace_votes(self.user, {self.questions[1].id: [(second.id, None)]})
+        self.assertEqual(list(Vote.objects.using(self.vote_aliases[0]).values_list('choice_id', flat=True)),
+                         [self.choices[0].id])
+        self.assertEqual(list(Vote.objects.using(self.vote_aliases[1]).values_list('choice_id', flat=True)),
+                         [second.id])
+
+    def test_deleting_choice_and_question_deletes_their_votes(self):
+        """The votes of deleted choices and questions are deleted from the vote databases."""
+        self.vote(self.choices[0])
+        self.vote(self.choices[1])
+        self.choices[0].delete()
+        self.assertFalse(Vote.objects.using(self.vote_aliases[0]).exists())
+        self.questions[1].delete()
+        self.assertFalse(Vote.objects.using(self.vote_aliases[1]).exists())
+        self.assertFalse(VoteStamp.objects.using(self.vote_aliases[1]).exists())
+
+    def test_deleting_user_deletes_their_votes(self):
+        """The votes of a deleted user are deleted from every vote database."""
+        self.vote(self.choices[0])
+        self.vote(self.choices[1])
+        stamp = self.questions[0].votes_modified()
+        self.user.delete()
+        for database in self.vote_aliases:
+            self.assertFalse(Vote.objects.using(database).exists())
+        self.assertGreater(self.questions[0].votes_modified(), stamp)
+
+    def test_interrupted_move_is_completed_by_a_new_run(self):
+        """Votes are copied before they are deleted, and copies are not made twice."""
+        Vote.objects.using('default').bulk_create(
+            [Vote(user=self.user, question=self.questions[0], choice=self.choices[0])])
+        with patch.object(VoteQuerySet, 'delete', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            call_command('rebalance_votes', stdout=StringIO())
+        self.assertEqual(Vote.objects.using('default').count(), 1)
+        self.assertEqual(Vote.objects.using(self.vote_aliases[0]).count(), 1)
+        call_command('rebalance_votes', stdout=StringIO())
+        self.assertFalse(Vote.objects.using('default').exists())
+        self.assertEqual(Vote.objects.using(self.vote_aliases[0]).count(), 1)
+
+    @override_settings(VOTE_DATABASES=['votes0'], RETIRED_VOTE_DATABASES=['votes1'])
+    def test_rebalance_empties_retired_databases(self):
+        """After lowering VOTE_SHARDS, the votes of the retired databases are moved back."""
+        Vote.objects.using('votes1').bulk_create(
+            [Vote(user=self.user, question=question, choice=choice)
+             for question, choice in zip(self.questions, self.choices)])
+        out = StringIO()
+        call_command('rebalance_votes', stdout=out)
+        self.assertIn("Moved 2 votes of 2 questions", out.getvalue())
+        self.assertIn("holds no votes any more", out.getvalue())
+        self.assertFalse(Vote.objects.using('votes1').exists())
+        self.assertEqual(Vote.objects.using('votes0').count(), 2)
+
+    def test_rebalance_moves_votes(self):
+        """rebalance_votes moves misplaced votes to the database of their question."""
+        Vote.objects.using('default').bulk_create(
+            [Vote(user=self.user, question=self.questions[0], choice=self.choices[0])])
+        Vote.objects.using(self.vote_aliases[0]).bulk_create(
+            [Vote(user=self.user, question=self.questions[1], choice=self.choices[1])])
+        out = StringIO()
+        call_command('rebalance_votes', stdout=out)
+        self.assertIn("Moved 2 votes of 2 questions", out.getvalue())
+        self.assertFalse(Vote.objects.using('default').exists())
+        for question, choice, database in zip(self.questions, self.choices, self.vote_aliases):
+            self.assertEqual(list(Vote.objects.using(database).values_list('question_id', 'choice_id')),
+                             [(question.id, choice.id)])
+            self.assertIsNotNone(question.votes_modified())
+
+
+class VoteStorageTest(TestCase):
+    """Test cases for votes stored with their question."""
+
+    def setUp(self):
+        self.question = create_question("Question", days=-1)
+        self.choices = [Choice.objects.create(question=self.question, choice_text=f"Choice {n}")
+                        for n in range(1, 3)]
+        for n in range(3):
+            user = User.objects.create_user(username=f"user{n}")
+            Vote.objects.create(user=user, choice=self.choices[n % 2])
+
+    def test_vote_question_is_taken_from_choice(self):
+        """Saving a vote without question uses the question of the choice."""
+        self.assertEqual(Vote.objects.for_question(self.question.id).count(), 3)
+
+    def test_vote_counts_in_one_query(self):
+        """The results counts come from one query."""
+        with self.assertNumQueries(1):
+            counts = self.question.get_vote_counts()
+        self.assertEqual(counts, {self.choices[0].id: 2, self.choices[1].id: 1})
+
+    def test_rebalance_without_vote_databases(self):
+        """Without vote databases, rebalancing leaves the votes where they are."""
+        out = StringIO()
+        call_command('rebalance_votes', stdout=out)
+        self.assertIn("Moved 0 votes", out.getvalue())
+
+
+class StartupTest(TestCase):
+    """Regression tests for the cold start of the application."""
+
+    def test_boot_time(self):
+        """mysite.wsgi boots within the time budget."""
+        result, _ = profile('wsgi', path='')
+        self.assertLess(result['boot'], 3)
+
+    def test_voting_worker_skips_optional_subsystems(self):
+        """Admin, accounts and messages are not imported when disabled."""
+        result, _ = profile('wsgi', path='', env={'ENABLE_ADMIN': 'False',
+                                                  'ENABLE_ACCOUNTS': 'False',
+                                                  'ENABLE_MESSAGES': 'False'})
+        self.assertFalse(any(result['loaded'].values()), result['loaded'])
+
+    def test_admin_follows_messages(self):
+        """Turning messages off also turns the admin off, so the checks pass."""
+        manage = django.conf.settings.BASE_DIR / 'manage.py'
+        completed = subprocess.run([sys.executable, manage, 'check'], capture_output=True, text=True,
+                                   env={**os.environ, 'ENABLE_MESSAGES': 'False'})
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        completed = subprocess.run([sys.executable, manage, 'check'], capture_output=True, text=True,
+                                   env={**os.environ, 'ENABLE_MESSAGES': 'False', 'ENABLE_ADMIN': 'True'})
+        self.assertIn("ENABLE_ADMIN needs ENABLE_MESSAGES", completed.stderr)
+
+    def test_vote_without_messages(self):
+        """Voting works when the messages middleware is left out."""
+        user = User.objects.create_user(username="testuser", password="FatChance!")
+        question = create_question("Question", days=-1)
+        choice = Choice.objects.create(question=question, choice_text="Choice")
+        self.client.force_login(user)
+        middleware = [name for name in django.conf.settings.MIDDLEWARE if 'messages' not in name]
+        with override_settings(MIDDLEWARE=middleware):
+            response = self.client.post(reverse('polls:vote', args=(question.id,)), {'choice': choice.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(choice.votes, 1)
+
+
+@patch('polls.warmup.PROCESS_LOCAL_CACHES', [])
+class WarmPollsTest(TransactionTestCase):
+    """Test cases for the warm_polls command."""
+
+    def setUp(self):
+        cache.clear()
+        self.questions = [create_question(f"Question {n}", days=-1) for n in range(3)]
+        users = [User.objects.create_user(username=f"user{n}") for n in range(3)]
+        for votes, question in enumerate(self.questions):
+            choice = Choice.objects.create(question=question, choice_text="Choice")
+            for user in users[:votes]:
+                Vote.objects.create(user=user, choice=choice)
+        closed = create_question("Closed question", days=-2)
+        closed.end_date = timezone.now() - datetime.timedelta(days=1)
+        closed.save()
+        Vote.objects.create(user=users[0], choice=Choice.objects.create(question=closed, choice_text="Choice"))
+        Vote.objects.create(user=users[1], choice=closed.choice_set.get())
+        Vote.objects.create(user=users[2], choice=closed.choice_set.get())
+
+    def test_most_voted_open_questions(self):
+        """Closed and unvoted questions are left out, the most voted come first."""
+        self.assertEqual(most_voted_open_questions(5), [self.questions[2], self.questions[1]])
+
+    def test_warm_polls_caches_results(self):
+        """The command caches the tallies and reports every task."""
+        out = StringIO()
+        call_command('warm_polls', limit=1, stdout=out)
+        self.assertIn(f"question {self.questions[2].id} results: ok", out.getvalue())
+        question = Question.objects.get(pk=self.questions[2].pk)
+        # only the vote stamp is read
+        with self.assertNumQueries(1):
+            question_vote_counts(question)
+
+    def test_pages_are_skipped_without_page_cache(self):
+        """Without the page cache, rendering the pages would store nothing."""
+        out = StringIO()
+        call_command('warm_polls', limit=1, stdout=out)
+        self.assertIn("index page: skipped, the page cache is off", out.getvalue())
+        self.assertIn("Warmed 1 of 3 tasks, 2 skipped, 0 failed", out.getvalue())
+
+    @override_settings(ALLOWED_HOSTS=['polls.example.com'], MIDDLEWARE=[
+        "polls.middleware.AnonymousUpdateCacheMiddleware",
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.common.CommonMiddleware",
+        "polls.middleware.CachedAuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+        "polls.middleware.AnonymousFetchFromCacheMiddleware",
+    ])
+    def test_pages_are_cached_for_allowed_host(self):
+        """With the page cache, the pages are requested with an allowed host and cached."""
+        out = StringIO()
+        call_command('warm_polls', limit=1, stdout=out)
+        self.assertIn("index page: ok, status 200", out.getvalue())
+        self.assertIn(f"question {self.questions[2].id} results page: ok, status 200", out.getvalue())
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'), HTTP_HOST='polls.example.com')
+        self.assertContains(response, "Question 2")
+
+    @override_settings(ALLOWED_HOSTS=[], MIDDLEWARE=["polls.middleware.AnonymousUpdateCacheMiddleware"])
+    def test_pages_are_skipped_without_allowed_host(self):
+        """Without a usable host, the pages are skipped instead of answered with 400."""
+        out = StringIO()
+        call_command('warm_polls', limit=1, stdout=out)
+        self.assertIn("index page: skipped, no host name in ALLOWED_HOSTS", out.getvalue())
+
+    def test_failed_page_is_reported(self):
+        """A page that is not answered with 200 counts as failed."""
+        with patch('polls.warmup.wsgi_request', return_value=400), \
+                override_settings(MIDDLEWARE=["polls.middleware.AnonymousUpdateCacheMiddleware"]):
+            out = StringIO()
+            call_command('warm_polls', limit=0, stdout=out)
+        self.assertIn("index page: failed, status 400 for host testserver", out.getvalue())
+        self.assertIn("1 failed", out.getvalue())
+
+    def test_skipped_with_process_local_cache(self):
+        """The command does not report a cache that is gone when it exits as warmed."""
+        out = StringIO()
+        with patch('polls.warmup.PROCESS_LOCAL_CACHES', ['django.core.cache.backends.locmem.LocMemCache']):
+            call_command('warm_polls', limit=1, stdout=out)
+        self.assertIn(f"question {self.questions[2].id} results: skipped, the cache is local", out.getvalue())
+        self.assertNotIn("templates", out.getvalue())
+        self.assertIn("Warmed 0 of 3 tasks, 3 skipped", out.getvalue())
+
+    @override_settings(CONN_MAX_AGE=60)
+    def test_worker_connects_in_serving_thread(self):
+        """With persistent connections, the starting thread opens them for its requests."""
+        connection.close()
+        with patch('polls.warmup.threading.Thread') as thread:
+            warm_in_background()
+        self.assertIsNotNone(connection.connection)
+        thread.return_value.start.assert_called_once()
+
+    def test_time_budget(self):
+        """Tasks not started within the budget are reported, not run."""
+        out = StringIO()
+        call_command('warm_polls', budget=0, workers=1, stdout=out)
+        self.assertIn("not finished within the time budget", out.getvalue())
@@ -9,4 +9,6 @@ urlpatterns = [
     path('polls/<int:pk>/', views.DetailView.as_view(), name='detail'),
     path('polls/<int:pk>/results/', views.ResultsView.as_view(), name='results'),
     path('polls/<int:question_id>/vote/', views.vote, name='vote'),
+    path('ballots/<int:pk>/', views.BallotView.as_view(), name='ballot'),
+    path('ballots/<int:ballot_id>/vote/', views.vote_ballot, name='vote-ballot'),
 ]
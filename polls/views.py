@@ -5,9 +5,11 @@ from django.urls import reverse
 from django.views import generic
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.utils.decorators import method_decorator
 
-
-from .models import Question, Choice, Vote
+from .models import Ballot, Question, Choice, Vote, VoteStamp, group_by_vote_database, vote_database
+from . import caching, tally
 
 
 class BaseIndexView(generic.DetailView):
@@ -18,6 +20,8 @@ class BaseIndexView(generic.DetailView):
         return HttpResponseRedirect(reverse('polls:index'))
 
 
+@method_decorator(caching.anonymous_condition(caching.index_etag, caching.index_last_modified),
+                  name='dispatch')
 class IndexView(generic.ListView):
     """A class representing an index view."""
 
@@ -44,8 +48,10 @@ class DetailView(generic.DetailView):
         try:
             question = Question.objects.get(pk=self.kwargs['pk'])
             if not question.can_vote():
-                messages.error(request, "‼️ Voting is not allowed for this question.")
+                messages.error(request, "‼️ Voting is not allowed for this question.", fail_silently=True)
                 return HttpResponseRedirect(reverse('polls:index'))
+            if question.kind != Question.SINGLE:
+                return render(request, 'polls/detail.html', _multiple_context(question, request.user))
             if request.user.is_authenticated:
                 return render(request, 'polls/detail.html', {
                     'question': question,
@@ -56,10 +62,12 @@ class DetailView(generic.DetailView):
                     'question': question,
                 })
         except Question.DoesNotExist:
-            messages.error(request, "‼️ The question you're looking for does not exist.")
+            messages.error(request, "‼️ The question you're looking for does not exist.", fail_silently=True)
             return HttpResponseRedirect(reverse('polls:index'))
 
 
+@method_decorator(caching.anonymous_condition(caching.results_etag, caching.results_last_modified),
+                  name='dispatch')
 class ResultsView(generic.DetailView):
     """A class representing a result view."""
 
@@ -71,41 +79,204 @@ class ResultsView(generic.DetailView):
         published_id_list = [q.id for q in Question.objects.all() if q.is_published()]
         return Question.objects.filter(id__in=published_id_list)
 
+    def get_context_data(self, **kwargs):
+        """Add the vote counts, or the instant runoff rounds of a ranked question."""
+        context = super().get_context_data(**kwargs)
+        if self.object.kind != Question.RANKED:
+            counts = tally.question_vote_counts(self.object)
+            context['choices'] = list(self.object.choice_set.all())
+            for choice in context['choices']:
+                choice.vote_count = counts.get(choice.id, 0)
+        else:
+            rounds, winner = tally.question_runoff(self.object)
+            choices = {choice.id: choice for choice in self.object.choice_set.all()}
+            context['rounds'] = [
+                {'counts': [(choices[choice_id], count) for choice_id, count in r.counts.items()],
+                 'exhausted': r.exhausted,
+                 'eliminated': [choices[choice_id] for choice_id in r.eliminated]}
+                for r in rounds]
+            context['winner'] = choices.get(winner)
+        return context
+
 
 @login_required
 def vote(request, question_id):
     """Return correct response to vote view request."""
     user = request.user
     question = get_object_or_404(Question, pk=question_id)
+    if question.kind != Question.SINGLE:
+        return _vote_multiple(request, question)
     try:
         selected_choice = question.choice_set.get(pk=request.POST['choice'])
     except (KeyError, Choice.DoesNotExist):
         if not KeyError:
-            messages.error(request, "‼️ You didn't select a choice.")
+            messages.error(request, "‼️ You didn't select a choice.", fail_silently=True)
         return render(request, 'polls/detail.html', {
             'question': question,
             'voted_choice': question.get_voted_choice(user)
         })
     else:
         # user already vote this choice
-        if Vote.objects.filter(choice=selected_choice, user=user).exists():
-            messages.error(request, "‼️ You have already voted this choice.")
+        if Vote.objects.for_question(question.id).filter(choice=selected_choice, user=user).exists():
+            messages.error(request, "‼️ You have already voted this choice.", fail_silently=True)
             return render(request, 'polls/detail.html', {
                 'question': question,
                 'voted_choice': question.get_voted_choice(user)
             })
         # user change choice from the same question
-        elif Vote.objects.filter(user=user, choice__question=question).exists():
+        elif Vote.objects.for_question(question.id).filter(user=user).exists():
             old_choice = question.get_voted_choice(user)
-            old_choice.vote_set.filter(user=user).delete()
-            old_choice.save()
             messages.success(request, f"✅ Your choice was successfully changed from "
                                       f"'{old_choice.choice_text}' "
-                                      f"to '{selected_choice.choice_text}'.")
+                                      f"to '{selected_choice.choice_text}'.", fail_silently=True)
         # the question has never been voted by the user before
         else:
-            messages.success(request, "✅ Your choice was successfully recorded. Thank you.")
-        # create new vote and update number of votes for selected choice
-        Vote.objects.create(user=user, choice=selected_choice)
-        selected_choice.save()
+            messages.success(request, "✅ Your choice was successfully recorded. Thank you.", fail_silently=True)
+        # only the database of the question's votes is written
+        with transaction.atomic(using=vote_database(question.id)):
+            Vote.objects.for_question(question.id).filter(user=user).delete()
+            Vote.objects.create(user=user, question=question, choice=selected_choice)
+            VoteStamp.objects.touch([question.id])
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+def read_selection(question, data, name):
+    """Return the list of (choice id, rank) selected for a question in form data.
+
+    Single and approval questions use the `name` field, ranked questions
+    use one `<name>-rank<choice id>` field per choice. Raise ValueError
+    with a message for the user if the selection is invalid.
+    """
+    choice_ids = {choice.id for choice in question.choice_set.all()}
+    if question.kind == Question.RANKED:
+        ranks = []
+        for choice_id in choice_ids:
+            value = data.get(f'{name}-rank{choice_id}', '').strip()
+            if not value:
+                continue
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError("Ranks must be positive numbers.")
+            ranks.append((int(value), choice_id))
+        if len({rank for rank, _ in ranks}) != len(ranks):
+            raise ValueError("Each rank can be given to one choice only.")
+        return [(choice_id, rank) for rank, (_, choice_id) in enumerate(sorted(ranks), 1)]
+    if question.kind == Question.APPROVAL:
+        values = data.getlist(name)
+    else:
+        values = [data.get(name, '')]
+    values = [value for value in values if value]
+    if not all(value.isdigit() and int(value) in choice_ids for value in values):
+        raise ValueError("Invalid choice.")
+    return [(choice_id, None) for choice_id in dict.fromkeys(map(int, values))]
+
+
+def replace_votes(user, selections):
+    """Replace the user's votes with selections, a dict of question id to (choice id, rank) list.
+
+    The votes and their stamps are replaced in one transaction per vote database.
+    """
+    for alias, question_ids in group_by_vote_database(selections).items():
+        with transaction.atomic(using=alias):
+            Vote.objects.using(alias).filter(user=user, question_id__in=question_ids).delete()
+            Vote.objects.using(alias).bulk_create(
+                [Vote(user=user, question_id=question_id, choice_id=choice_id, rank=rank)
+                 for question_id in question_ids
+                 for choice_id, rank in selections[question_id]])
+            VoteStamp.objects.touch(question_ids)
+
+
+def _mark_voted(choices, ranks):
+    """Return the choices as a list, marked as voted from a dict of choice id to rank."""
+    choices = list(choices)
+    for choice in choices:
+        choice.voted = choice.id in ranks
+        choice.voted_rank = ranks.get(choice.id)
+    return choices
+
+
+def _multiple_context(question, user):
+    """Return the context of the detail page of an approval or ranked question."""
+    voted = question.get_voted_ranks(user) if user.is_authenticated else {}
+    return {'question': question, 'choices': _mark_voted(question.choice_set.all(), voted)}
+
+
+def _vote_multiple(request, question):
+    """Record the votes for an approval or ranked question."""
+    try:
+        selection = read_selection(question, request.POST, 'choice')
+    except ValueError as error:
+        messages.error(request, f"‼️ {error}", fail_silently=True)
+        return render(request, 'polls/detail.html', _multiple_context(question, request.user))
+    if not selection:
+        messages.error(request, "‼️ You didn't select a choice.", fail_silently=True)
+        return render(request, 'polls/detail.html', _multiple_context(question, request.user))
+    replace_votes(request.user, {question.id: selection})
+    messages.success(request, "✅ Your choices were successfully recorded. Thank you.", fail_silently=True)
     return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+def _submitted_ranks(question, data, name):
+    """Return a dict of choice id to rank, as typed (or None), of the choices selected in form data."""
+    choices = question.choice_set.all()
+    if question.kind == Question.RANKED:
+        ranks = {choice.id: data.get(f'{name}-rank{choice.id}', '').strip() for choice in choices}
+        return {choice_id: rank for choice_id, rank in ranks.items() if rank}
+    values = data.getlist(name)
+    return {choice.id: None for choice in choices if str(choice.id) in values}
+
+
+def _ballot_context(ballot, user, data=None):
+    """Return the context for rendering a ballot form.
+
+    The choices are selected as in the submitted form data if given,
+    so a rejected ballot keeps the answers, otherwise as the user voted.
+    """
+    questions = ballot.open_questions()
+    voted = {}
+    if data is not None:
+        for question in questions:
+            voted[question.id] = _submitted_ranks(question, data, f'question{question.id}')
+    elif user.is_authenticated:
+        voted = Vote.objects.ranks_of_user(user, [question.id for question in questions])
+    for question in questions:
+        question.choices = _mark_voted(question.choice_set.all(), voted.get(question.id, {}))
+    return {'ballot': ballot, 'questions': questions}
+
+
+class BallotView(generic.DetailView):
+    """A class for the form of all questions in a ballot."""
+
+    model = Ballot
+    template_name = 'polls/ballot.html'
+
+    def get_context_data(self, **kwargs):
+        """Add the open questions and the choices the user already voted."""
+        context = super().get_context_data(**kwargs)
+        context.update(_ballot_context(self.object, self.request.user))
+        return context
+
+
+@login_required
+def vote_ballot(request, ballot_id):
+    """Record the answers to all questions of a ballot in one transaction."""
+    user = request.user
+    ballot = get_object_or_404(Ballot, pk=ballot_id)
+    questions = ballot.open_questions()
+    selections = {}
+    for question in questions:
+        try:
+            selection = read_selection(question, request.POST, f'question{question.id}')
+        except ValueError as error:
+            messages.error(request, f"‼️ {question.question_text}: {error}", fail_silently=True)
+            return render(request, 'polls/ballot.html', _ballot_context(ballot, user, request.POST))
+        if selection:
+            selections[question.id] = sorted(selection)
+    if not selections:
+        messages.error(request, "‼️ You didn't select any choice.", fail_silently=True)
+        return render(request, 'polls/ballot.html', _ballot_context(ballot, user, request.POST))
+    old_selections = Vote.objects.ranks_of_user(user, selections)
+    # only rewrite the answers that changed
+    replace_votes(user, {question_id: selection for question_id, selection in selections.items()
+                         if sorted(old_selections.get(question_id, {}).items()) != selection})
+    messages.success(request, "✅ Your ballot was successfully recorded. Thank you.", fail_silently=True)
+    return HttpResponseRedirect(reverse('polls:ballot', args=(ballot.id,)))
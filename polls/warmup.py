@@ -0,0 +1,188 @@
+"""Warm up caches after a deploy, before the first visitors arrive.
+
+Templates only warm the current process, and database connections only
+the current thread, so call warm_in_background() from each worker
+(WARM_ON_STARTUP). The results tallies and cached pages go to the
+configured cache, so ``manage.py warm_polls`` warms them for every worker
+when that cache is shared, and skips them when it is not.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Q
+from django.http.request import validate_host
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Question, Vote
+from .startup import wsgi_request
+from . import tally
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = ['polls/base.html', 'polls/index.html', 'polls/detail.html',
+             'polls/results.html', 'polls/ballot.html', 'registration/login.html']
+
+PAGE_CACHE_MIDDLEWARE = 'polls.middleware.AnonymousUpdateCacheMiddleware'
+
+PROCESS_LOCAL_CACHES = ['django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache']
+
+
+class WarmUpSkipped(Exception):
+    """Raised by a task that cannot do anything useful with the current settings."""
+
+
+class WarmUpFailed(Exception):
+    """Raised by a task that did not warm what it should have."""
+
+
+def most_voted_open_questions(limit):
+    """Return the open questions with the most votes, most voted first."""
+    votes = Counter()
+    for alias in [DEFAULT_DB_ALIAS, *settings.VOTE_DATABASES]:
+        votes.update(dict(Vote.objects.using(alias).order_by()
+                          .values_list('question_id').annotate(Count('id'))))
+    now = timezone.now()
+    questions = Question.objects.filter(pk__in=list(votes), pub_date__lte=now) \
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=now))
+    return sorted(questions, key=lambda question: votes[question.pk], reverse=True)[:limit]
+
+
+def open_connections():
+    """Connect to the default and vote databases in this thread and return their aliases."""
+    aliases = [DEFAULT_DB_ALIAS, *settings.VOTE_DATABASES]
+    for alias in aliases:
+        connections[alias].ensure_connection()
+    return ', '.join(aliases)
+
+
+def compile_templates():
+    """Load and compile the templates of the polls pages."""
+    for name in TEMPLATES:
+        get_template(name)
+    return f"{len(TEMPLATES)} templates"
+
+
+def _host():
+    """Return a host name that ALLOWED_HOSTS accepts, or None.
+
+    The page cache is kept per host, so the first one listed is used.
+    """
+    allowed = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed:
+        allowed = ['.localhost', '127.0.0.1', '[::1]']
+    for pattern in allowed:
+        host = 'localhost' if pattern == '*' else pattern.lstrip('.')
+        if host and validate_host(host, allowed):
+            return host
+    return None
+
+
+def warm_page(application, path):
+    """Request a page as an anonymous visitor, which stores it in the page cache."""
+    if PAGE_CACHE_MIDDLEWARE not in settings.MIDDLEWARE:
+        raise WarmUpSkipped("the page cache is off (CACHE_ANONYMOUS_PAGES)")
+    host = _host()
+    if host is None:
+        raise WarmUpSkipped("no host name in ALLOWED_HOSTS to request it with")
+    status = wsgi_request(application, path, host)
+    if status != 200:
+        raise WarmUpFailed(f"status {status} for host {host}")
+    return f"status {status}"
+
+
+def warm_results(question):
+    """Compute and cache the results of a question."""
+    if question.kind == Question.RANKED:
+        tally.question_runoff(question)
+    else:
+        tally.question_vote_counts(question)
+    return "tally cached"
+
+
+def _in_shared_cache(task):
+    """Return the task, skipped if what it caches would be lost with this process."""
+    def run():
+        if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+            raise WarmUpSkipped("the cache is local to this process (CACHE_BACKEND)")
+        return task()
+    return run
+
+
+def _run(task):
+    start = time.perf_counter()
+    try:
+        status, outcome = 'ok', task()
+    except WarmUpSkipped as reason:
+        status, outcome = 'skipped', str(reason)
+    except WarmUpFailed as error:
+        status, outcome = 'failed', str(error)
+    except Exception as error:
+        status, outcome = 'failed', repr(error)
+    finally:
+        # a connection of a pool thread is never reused
+        connections.close_all()
+    return status, outcome, time.perf_counter() - start
+
+
+def warm(limit=10, budget=10.0, workers=4, in_worker=False):
+    """Warm the caches of the index and the `limit` most voted open questions.
+
+    Only a worker (`in_worker`) compiles its templates. Elsewhere, the
+    cache tasks are skipped when the cache is local to this process.
+    The tasks run in a pool of `workers` threads. Tasks not started when
+    the `budget` in seconds is spent are cancelled.
+    Return a list of (task, status, outcome, seconds). status is 'ok',
+    'skipped', 'failed' or 'unfinished'; seconds is None if unfinished.
+    """
+    deadline = time.monotonic() + budget
+    application = WSGIHandler()
+    tasks = {'templates': compile_templates} if in_worker else {}
+    tasks['index page'] = lambda: warm_page(application, reverse('polls:index'))
+    for question in most_voted_open_questions(limit):
+        tasks[f'question {question.pk} results'] = lambda question=question: warm_results(question)
+        path = reverse('polls:results', args=(question.pk,))
+        tasks[f'question {question.pk} results page'] = lambda path=path: warm_page(application, path)
+    if not in_worker:
+        tasks = {name: _in_shared_cache(task) for name, task in tasks.items()}
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm-polls')
+    futures = {executor.submit(_run, task): name for name, task in tasks.items()}
+    done, _ = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    executor.shutdown(wait=False, cancel_futures=True)
+    report = []
+    for future, name in futures.items():
+        if future in done:
+            report.append((name, *future.result()))
+        else:
+            report.append((name, 'unfinished', "not finished within the time budget", None))
+    return report
+
+
+def warm_in_background(connect=True):
+    """Warm up a starting worker, logging the report.
+
+    With connect and CONN_MAX_AGE set, the database connections are opened
+    right away in the calling thread, for a worker that serves requests
+    in the thread that loads the application (e.g. sync WSGI workers).
+    The rest runs in a daemon thread with the WARM_POLLS_* settings.
+    """
+    if connect and settings.CONN_MAX_AGE:
+        start = time.perf_counter()
+        aliases = open_connections()
+        logger.info("warm up databases: ok, %s (%.0f ms)", aliases, (time.perf_counter() - start) * 1000)
+
+    def run():
+        report = warm(settings.WARM_POLLS_LIMIT, settings.WARM_POLLS_BUDGET, in_worker=True)
+        for name, status, outcome, seconds in report:
+            logger.info("warm up %s: %s, %s%s", name, status, outcome,
+                        "" if seconds is None else f" ({seconds * 1000:.0f} ms)")
+        connections.close_all()
+    threading.Thread(target=run, name='warm-polls', daemon=True).start()